@@ -9,10 +9,16 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'src')))
 
 # Importa tus funciones y el modelo/encoder
-from data_loader import load_all_league_data
+from data_loader import load_league_data
 from predictor import load_model_and_encoder, make_prediction_for_match
+from feature_engineer import build_team_state
+from shared_state import attach_shared_state, get_shared_team_state
 # from model_trainer import train_and_evaluate_model # Solo si necesitas re-entrenar desde la app
 
+# Si está definida, los datos y el modelo se toman de la memoria compartida publicada por
+# src/shared_state.py en lugar de cargarlos en cada proceso de Streamlit.
+SHARED_STATE_PREFIX = os.environ.get('FOOTBALL_AI_SHARED_STATE')
+
 # --- Configuración de la Interfaz ---
 st.set_page_config(page_title="Pronóstico de Fútbol con IA", layout="centered")
 st.title("⚽ Pronóstico de Fútbol con IA")
@@ -22,7 +28,7 @@ st.markdown("---")
 @st.cache_data # Carga los datos una sola vez para mejorar el rendimiento
 def load_data():
     st.write("Cargando datos históricos de la Premier League...")
-    df_raw = load_all_league_data(data_folder='data') # O './data' si app.py está en la raíz
+    df_raw = load_league_data(data_folder='data') # O './data' si app.py está en la raíz
     st.write(f"Datos cargados: {len(df_raw)} partidos.")
     return df_raw
 
@@ -35,17 +41,39 @@ def load_model():
         st.error("Error al cargar el modelo o el LabelEncoder. Asegúrate de haber ejecutado main.py al menos una vez para entrenarlos y guardarlos.")
     return model, encoder
 
-df_raw = load_data()
-model, label_encoder = load_model()
+@st.cache_resource # Estado de los equipos e índice H2H: se acumulan una vez y cada predicción es O(1)
+def load_team_state():
+    return build_team_state(load_data())
 
-if model and label_encoder and not df_raw.empty:
-    # --- Selección de Equipos ---
-    st.header("Realizar una Predicción")
+@st.cache_resource # Un único contenedor por proceso; la versión se comprueba en cada ejecución
+def get_shared_state_holder():
+    return {'state': None}
 
+if SHARED_STATE_PREFIX:
+    shared_state_holder = get_shared_state_holder()
+    shared_state_holder['state'] = attach_shared_state(prefix=SHARED_STATE_PREFIX, current=shared_state_holder['state'])
+    shared_state = shared_state_holder['state']
+    if shared_state is None:
+        st.error("No hay estado compartido publicado. Ejecuta `python src/shared_state.py` antes de iniciar la app.")
+        all_teams_sorted, model, label_encoder = [], None, None
+    else:
+        # El estado de los equipos ya está acumulado por el cargador: el worker no lee ni recorre el historial
+        all_teams_sorted = shared_state['teams']
+        model = shared_state['model']
+        label_encoder = shared_state['label_encoder']
+else:
+    shared_state = None
+    df_raw = load_data()
+    model, label_encoder = load_model()
+    team_state = load_team_state()
     # Obtener la lista de todos los equipos únicos del DataFrame
     all_teams = pd.Series(df_raw['HomeTeam'].unique().tolist() + df_raw['AwayTeam'].unique().tolist()).unique()
     all_teams_sorted = sorted(all_teams) # Ordenar alfabéticamente
 
+if model and label_encoder and len(all_teams_sorted) > 0:
+    # --- Selección de Equipos ---
+    st.header("Realizar una Predicción")
+
     col1, col2 = st.columns(2)
     with col1:
         home_team_future = st.selectbox("Selecciona Equipo Local:", all_teams_sorted)
@@ -61,12 +89,16 @@ if model and label_encoder and not df_raw.empty:
     else:
         if st.button("Predecir Resultado"):
             with st.spinner("Calculando predicción..."):
+                if shared_state is not None:
+                    # Solo se leen de la memoria compartida los dos equipos y su pareja H2H
+                    team_state = get_shared_team_state(shared_state, home_team_future, away_team_future)
                 prediction_results = make_prediction_for_match(
                     home_team_future,
                     away_team_future,
-                    df_raw.copy(), # Pasa una copia de los datos brutos
+                    None, # No se usa: el estado de los equipos ya está calculado
                     model,
-                    label_encoder
+                    label_encoder,
+                    team_state=team_state
                 )
                 st.success("¡Predicción realizada!")
                 st.write("---")
@@ -88,7 +120,7 @@ if model and label_encoder and not df_raw.empty:
                     st.metric(label=display_label, value=f"{prob:.2%}") # Mostrar la probabilidad con la etiqueta descriptiva
 elif not model or not label_encoder:
     st.error("El modelo no se pudo cargar. Asegúrate de ejecutar `python src/main.py` para entrenarlo y guardarlo.")
-elif df_raw.empty:
+elif len(all_teams_sorted) == 0:
     st.error("No se pudieron cargar los datos históricos. Asegúrate de que los CSVs estén en la carpeta 'data'.")
 
 st.markdown("---")
@@ -2,6 +2,9 @@
 
 import pandas as pd
 import os
+import json
+import shutil
+import tempfile
 
 def load_all_league_data(data_folder='../data', league_prefix='E0'):
     """
@@ -25,14 +28,8 @@ def load_all_league_data(data_folder='../data', league_prefix='E0'):
         except UnicodeDecodeError:
             df = pd.read_csv(file, encoding='utf-8') # Otra opción de codificación
 
-        # Añadir la temporada al DataFrame (opcional, para referencia)
-        filename = os.path.basename(file)
-        if '(' in filename and ')' in filename:
-            season_str = filename.split('(')[1].split(')')[0]
-            df['Season'] = season_str
-        else:
-            # Para el archivo "E0.csv" que es la temporada actual sin paréntesis
-            df['Season'] = 'Current' 
+        # Añadir la temporada al DataFrame, inferida de las fechas del archivo (no de su nombre)
+        df['Season'] = infer_season_label(pd.to_datetime(df['Date'], dayfirst=True, errors='coerce'))
 
         df_list.append(df)
     
@@ -61,7 +58,7 @@ def load_all_league_data(data_folder='../data', league_prefix='E0'):
     
     # Filtrar solo las columnas que nos interesan y existen en el DataFrame
     # Esto manejará el caso de que algunas temporadas no tengan todas las columnas
-    filtered_cols = [col for col in expected_cols.values() if col in full_df.columns]
+    filtered_cols = [col for col in list(expected_cols.values()) + ['Season'] if col in full_df.columns]
     full_df = full_df[filtered_cols]
 
     # Convertir 'Date' a formato de fecha
@@ -79,3 +76,207 @@ def load_all_league_data(data_folder='../data', league_prefix='E0'):
     
     return full_df
 
+def infer_season_label(dates):
+    """
+    Infiere la etiqueta de temporada de un archivo a partir de las fechas de sus partidos.
+    Se asume el formato de Football-Data.co.uk: un archivo por temporada, que empieza en
+    agosto/septiembre. La etiqueta sale del año del primer partido (ej. 13/08/2021 -> '2021-2022'),
+    así que una temporada alargada hasta julio (2019-2020 terminó el 26/07/2020) no se parte en dos.
+
+    Args:
+        dates (pd.Series): Serie de fechas (datetime) de los partidos de un mismo archivo.
+
+    Returns:
+        str: La etiqueta de temporada, o None si el archivo no tiene fechas válidas.
+    """
+    first_date = dates.min()
+    if pd.isna(first_date):
+        return None
+    return f'{first_date.year}-{first_date.year + 1}'
+
+def _league_source_files(data_folder, league_prefix):
+    """Rutas de los CSV de una liga (mismo criterio que load_all_league_data)."""
+    return [os.path.join(data_folder, f) for f in os.listdir(data_folder) if f.startswith(league_prefix) and f.endswith('.csv')]
+
+def _source_manifest(data_folder, league_prefix):
+    """Nombre, tamaño y fecha de modificación de cada CSV de la liga, para detectar cualquier cambio."""
+    manifest = {}
+    for file in _league_source_files(data_folder, league_prefix):
+        stat = os.stat(file)
+        manifest[os.path.basename(file)] = [stat.st_size, stat.st_mtime_ns]
+    return manifest
+
+def _write_atomic(path, write_func):
+    """Escribe con write_func en un archivo temporal único y lo renombra sobre 'path'."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        write_func(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def ingest_league_data(data_folder='../data', league_prefix='E0', dataset_folder='../data/partitioned'):
+    """
+    Carga los CSV de una liga y los escribe en un dataset Parquet particionado
+    por liga y temporada (estructura 'League=E0/Season=2021-2022/part.parquet').
+    Las temporadas de la liga que ya no aparecen en los CSV se eliminan del dataset.
+    En '_seasons.json' se guardan el rango de fechas de cada temporada y el manifiesto
+    de los CSV leídos (ver partitioned_data_is_stale).
+
+    Args:
+        data_folder (str): La ruta a la carpeta donde se encuentran los archivos CSV.
+        league_prefix (str): El prefijo de los archivos de la liga (ej. 'E0' para Premier League).
+        dataset_folder (str): La carpeta raíz del dataset particionado.
+
+    Returns:
+        pd.DataFrame: El DataFrame consolidado con la columna 'Season'.
+    """
+    # El manifiesto se toma antes de leer: si un CSV cambia durante la ingesta, la próxima carga lo detecta
+    sources = _source_manifest(data_folder, league_prefix)
+    full_df = load_all_league_data(data_folder=data_folder, league_prefix=league_prefix)
+
+    # Algunos CSV traen BOM y pierden la columna 'Div' al leerlos en latin1; usamos el prefijo como respaldo
+    if 'League' not in full_df.columns:
+        full_df['League'] = league_prefix
+    full_df['League'] = full_df['League'].fillna(league_prefix)
+
+    for league, league_df in full_df.groupby('League'):
+        league_dir = os.path.join(dataset_folder, f'League={league}')
+        os.makedirs(league_dir, exist_ok=True)
+
+        # Rango real de fechas de cada temporada, para podar por fecha sin abrir los Parquet
+        season_ranges = {}
+        for season, partition_df in league_df.groupby('Season'):
+            partition_dir = os.path.join(league_dir, f'Season={season}')
+            os.makedirs(partition_dir, exist_ok=True)
+            # Archivo temporal + rename: los lectores nunca ven una partición a medias
+            _write_atomic(os.path.join(partition_dir, 'part.parquet'),
+                          lambda tmp_path: partition_df.to_parquet(tmp_path, index=False))
+            season_ranges[season] = [partition_df['Date'].min().isoformat(), partition_df['Date'].max().isoformat()]
+
+        def write_ranges(tmp_path):
+            with open(tmp_path, 'w') as f:
+                json.dump({'sources': sources, 'seasons': season_ranges}, f)
+        _write_atomic(os.path.join(league_dir, '_seasons.json'), write_ranges)
+
+        # Borrar las temporadas que no se han reescrito (desaparecidas o reetiquetadas)
+        for season_dir in os.listdir(league_dir):
+            if season_dir.startswith('Season=') and season_dir.split('=', 1)[1] not in season_ranges:
+                shutil.rmtree(os.path.join(league_dir, season_dir), ignore_errors=True)
+
+    print(f"Dataset particionado escrito en {dataset_folder}: {full_df['Season'].nunique()} temporadas de la liga {league_prefix}.")
+
+    return full_df
+
+def partitioned_data_is_stale(data_folder='../data', league_prefix='E0', dataset_folder='../data/partitioned'):
+    """
+    Indica si el dataset particionado de una liga falta o no corresponde a sus CSV actuales:
+    cualquier archivo añadido, borrado, renombrado o con otro tamaño o fecha obliga a reingerir.
+
+    Returns:
+        bool: True si hay que volver a ejecutar ingest_league_data.
+    """
+    seasons_file = os.path.join(dataset_folder, f'League={league_prefix}', '_seasons.json')
+    if not os.path.exists(seasons_file):
+        return True
+    with open(seasons_file) as f:
+        ingested_sources = json.load(f).get('sources')
+    return ingested_sources != _source_manifest(data_folder, league_prefix)
+
+def load_league_data(data_folder='../data', league_prefix='E0', dataset_folder=None, **filters):
+    """
+    Punto de entrada común para cargar los partidos de una liga: reingiere los CSV en el
+    dataset particionado si han cambiado y después carga solo las particiones pedidas.
+
+    Args:
+        data_folder (str): La ruta a la carpeta donde se encuentran los archivos CSV.
+        league_prefix (str): El prefijo de los archivos de la liga (ej. 'E0' para Premier League).
+        dataset_folder (str, opcional): La carpeta del dataset particionado. Por defecto 'data_folder/partitioned'.
+        **filters: 'seasons', 'start_date' y 'end_date', como en load_partitioned_league_data.
+
+    Returns:
+        pd.DataFrame: Un DataFrame con los partidos seleccionados, ordenado por fecha.
+    """
+    if dataset_folder is None:
+        dataset_folder = os.path.join(data_folder, 'partitioned')
+    if partitioned_data_is_stale(data_folder, league_prefix, dataset_folder):
+        print("Los CSV han cambiado desde la última ingesta. Actualizando el dataset particionado...")
+        ingest_league_data(data_folder=data_folder, league_prefix=league_prefix, dataset_folder=dataset_folder)
+    return load_partitioned_league_data(dataset_folder=dataset_folder, leagues=[league_prefix], **filters)
+
+def load_partitioned_league_data(dataset_folder='../data/partitioned', leagues=None, seasons=None,
+                                 start_date=None, end_date=None):
+    """
+    Carga partidos del dataset particionado, podando las particiones que no
+    cumplen los filtros antes de leer ningún archivo.
+
+    Args:
+        dataset_folder (str): La carpeta raíz del dataset particionado.
+        leagues (list, opcional): Ligas a cargar (ej. ['E0']). None carga todas.
+        seasons (list, opcional): Temporadas a cargar (ej. ['2023-2024']). None carga todas.
+        start_date (str o datetime, opcional): Fecha mínima (inclusive) de los partidos.
+        end_date (str o datetime, opcional): Fecha máxima (inclusive) de los partidos.
+
+    Returns:
+        pd.DataFrame: Un DataFrame con los partidos seleccionados, ordenado por fecha.
+    """
+    start_date = pd.to_datetime(start_date) if start_date is not None else None
+    end_date = pd.to_datetime(end_date) if end_date is not None else None
+
+    if not os.path.isdir(dataset_folder):
+        print(f"Advertencia: El dataset particionado '{dataset_folder}' no existe.")
+        return pd.DataFrame()
+
+    selected_files = []
+    for league_dir in sorted(os.listdir(dataset_folder)):
+        if not league_dir.startswith('League='):
+            continue
+        league = league_dir.split('=', 1)[1]
+        if leagues is not None and league not in leagues:
+            continue
+
+        league_path = os.path.join(dataset_folder, league_dir)
+        seasons_file = os.path.join(league_path, '_seasons.json')
+        season_ranges = {}
+        if os.path.exists(seasons_file):
+            with open(seasons_file) as f:
+                season_ranges = json.load(f).get('seasons', {})
+
+        for season_dir in sorted(os.listdir(league_path)):
+            if not season_dir.startswith('Season='):
+                continue
+            season = season_dir.split('=', 1)[1]
+            if seasons is not None and season not in seasons:
+                continue
+
+            # Poda por fechas: descartamos temporadas que no se solapan con el rango pedido
+            if season in season_ranges:
+                season_start, season_end = (pd.Timestamp(d) for d in season_ranges[season])
+                if start_date is not None and season_end < start_date:
+                    continue
+                if end_date is not None and season_start > end_date:
+                    continue
+
+            part_file = os.path.join(league_path, season_dir, 'part.parquet')
+            if os.path.exists(part_file):
+                selected_files.append(part_file)
+
+    if not selected_files:
+        print("Advertencia: Ninguna partición coincide con los filtros indicados.")
+        return pd.DataFrame()
+
+    full_df = pd.concat([pd.read_parquet(f) for f in selected_files], ignore_index=True)
+
+    # Filtrado fino por fecha dentro de las particiones seleccionadas
+    if start_date is not None:
+        full_df = full_df[full_df['Date'] >= start_date]
+    if end_date is not None:
+        full_df = full_df[full_df['Date'] <= end_date]
+
+    full_df = full_df.sort_values(by='Date').reset_index(drop=True)
+
+    print(f"Cargados {len(full_df)} partidos de {len(selected_files)} particiones.")
+
+    return full_df
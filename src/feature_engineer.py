@@ -3,21 +3,324 @@
 import pandas as pd
 import numpy as np
 
-def calculate_team_stats(df):
+# Número de enfrentamientos directos recientes que se guardan por pareja de equipos
+H2H_LAST_N = 5
+
+def _h2h_key(team_a, team_b):
+    """Clave del índice H2H: la pareja de equipos sin orden (A vs B == B vs A)."""
+    return tuple(sorted((team_a, team_b)))
+
+def get_h2h_features(h2h_index, home_team, away_team):
+    """
+    Devuelve las características de enfrentamientos directos (H2H) antes del partido,
+    desde la perspectiva del equipo local. El coste es constante: solo se leen contadores.
+
+    Args:
+        h2h_index (dict): Índice H2H construido con update_h2h_index.
+        home_team (str): Nombre del equipo local.
+        away_team (str): Nombre del equipo visitante.
+
+    Returns:
+        dict: Diccionario con las características H2H del partido.
+    """
+    pair_stats = h2h_index.get(_h2h_key(home_team, away_team))
+    if pair_stats is None:
+        return {
+            'H2H_Matches_Prev': 0, 'H2H_HomeTeam_WinRatio_Prev': 0, 'H2H_DrawRatio_Prev': 0,
+            'H2H_AwayTeam_WinRatio_Prev': 0, 'H2H_HomeTeam_AvgGoalDiff_Prev': 0,
+            f'H2H_HomeTeam_Wins_Last{H2H_LAST_N}': 0, f'H2H_Draws_Last{H2H_LAST_N}': 0, f'H2H_HomeTeam_Losses_Last{H2H_LAST_N}': 0,
+            'H2H_Venue_Matches_Prev': 0, 'H2H_Venue_HomeWinRatio_Prev': 0, 'H2H_Venue_AvgGoalDiff_Prev': 0,
+        }
+
+    matches = pair_stats['Matches']
+    home_wins = pair_stats['Wins'][home_team]
+    away_wins = pair_stats['Wins'][away_team]
+    # La diferencia de goles se guarda desde la perspectiva del primer equipo de la clave
+    goal_diff = pair_stats['GoalDiff'] if _h2h_key(home_team, away_team)[0] == home_team else -pair_stats['GoalDiff']
+    last_results = pair_stats['LastResults'] # Ganador de cada enfrentamiento reciente (nombre del equipo o 'D')
+    venue_stats = pair_stats['Venue'][home_team] # Partidos en los que el local actual jugó en casa contra este rival
+
+    return {
+        'H2H_Matches_Prev': matches,
+        'H2H_HomeTeam_WinRatio_Prev': home_wins / matches,
+        'H2H_DrawRatio_Prev': pair_stats['Draws'] / matches,
+        'H2H_AwayTeam_WinRatio_Prev': away_wins / matches,
+        'H2H_HomeTeam_AvgGoalDiff_Prev': goal_diff / matches,
+
+        # Resultados de los últimos enfrentamientos directos
+        f'H2H_HomeTeam_Wins_Last{H2H_LAST_N}': last_results.count(home_team) / len(last_results),
+        f'H2H_Draws_Last{H2H_LAST_N}': last_results.count('D') / len(last_results),
+        f'H2H_HomeTeam_Losses_Last{H2H_LAST_N}': last_results.count(away_team) / len(last_results),
+
+        # Historial en el mismo estadio (el local actual recibiendo al visitante actual)
+        'H2H_Venue_Matches_Prev': venue_stats['Matches'],
+        'H2H_Venue_HomeWinRatio_Prev': venue_stats['Wins'] / venue_stats['Matches'] if venue_stats['Matches'] > 0 else 0,
+        'H2H_Venue_AvgGoalDiff_Prev': venue_stats['GoalDiff'] / venue_stats['Matches'] if venue_stats['Matches'] > 0 else 0,
+    }
+
+def update_h2h_index(h2h_index, home_team, away_team, home_goals, away_goals):
+    """
+    Actualiza el índice H2H con el resultado de un partido ya jugado.
+
+    Args:
+        h2h_index (dict): Índice H2H a actualizar (se modifica en el sitio).
+        home_team (str): Nombre del equipo local.
+        away_team (str): Nombre del equipo visitante.
+        home_goals (int): Goles del equipo local.
+        away_goals (int): Goles del equipo visitante.
+    """
+    key = _h2h_key(home_team, away_team)
+    if key not in h2h_index:
+        h2h_index[key] = {
+            'Matches': 0, 'Draws': 0, 'GoalDiff': 0, 'LastResults': [],
+            'Wins': {key[0]: 0, key[1]: 0},
+            'Venue': {team: {'Matches': 0, 'Wins': 0, 'GoalDiff': 0} for team in key},
+        }
+    pair_stats = h2h_index[key]
+
+    pair_stats['Matches'] += 1
+    pair_stats['GoalDiff'] += (home_goals - away_goals) if key[0] == home_team else (away_goals - home_goals)
+
+    if home_goals > away_goals:
+        winner = home_team
+    elif home_goals < away_goals:
+        winner = away_team
+    else:
+        winner = 'D'
+
+    if winner == 'D':
+        pair_stats['Draws'] += 1
+    else:
+        pair_stats['Wins'][winner] += 1
+
+    pair_stats['LastResults'].append(winner)
+    # Mantener solo los últimos N enfrentamientos
+    if len(pair_stats['LastResults']) > H2H_LAST_N:
+        pair_stats['LastResults'].pop(0)
+
+    venue_stats = pair_stats['Venue'][home_team]
+    venue_stats['Matches'] += 1
+    venue_stats['GoalDiff'] += home_goals - away_goals
+    if winner == home_team:
+        venue_stats['Wins'] += 1
+
+def _new_team_stats():
+    """Contadores iniciales de un equipo sin partidos previos."""
+    return {
+        'MatchesPlayed': 0, 'GoalsScored': 0, 'GoalsConceded': 0, 'ShotsTarget': 0,
+        'Corners': 0, 'Fouls': 0, 'YellowCards': 0, 'RedCards': 0, 'Wins': 0, 'Draws': 0, 'Losses': 0,
+        'Last5GoalsScored': [], 'Last5GoalsConceded': [], 'Last5Results': [],
+        'HomeGoalsScored': 0, 'HomeGoalsConceded': 0, 'HomeWins': 0, 'HomeDraws': 0, 'HomeLosses': 0,
+        'AwayGoalsScored': 0, 'AwayGoalsConceded': 0, 'AwayWins': 0, 'AwayDraws': 0, 'AwayLosses': 0,
+    }
+
+def get_match_features(team_stats, h2h_index, home_team, away_team):
+    """
+    Calcula las características de un partido a partir del estado acumulado de los equipos
+    y del índice H2H, sin recorrer el historial. No modifica team_stats.
+
+    Args:
+        team_stats (dict): Estadísticas acumuladas por equipo (ver update_team_stats).
+        h2h_index (dict): Índice H2H (ver update_h2h_index).
+        home_team (str): Nombre del equipo local.
+        away_team (str): Nombre del equipo visitante.
+
+    Returns:
+        dict: Características del equipo local, del visitante, relativas y H2H.
+    """
+    # Vista con solo los dos equipos del partido; un equipo sin historial usa contadores a cero
+    team_stats = {
+        home_team: team_stats.get(home_team) or _new_team_stats(),
+        away_team: team_stats.get(away_team) or _new_team_stats(),
+    }
+
+    # --- Características del equipo local antes del partido ---
+    home_features = {
+        f'Home_AvgGoalsScored_Prev': team_stats[home_team]['GoalsScored'] / team_stats[home_team]['MatchesPlayed'] if team_stats[home_team]['MatchesPlayed'] > 0 else 0,
+        f'Home_AvgGoalsConceded_Prev': team_stats[home_team]['GoalsConceded'] / team_stats[home_team]['MatchesPlayed'] if team_stats[home_team]['MatchesPlayed'] > 0 else 0,
+        f'Home_AvgShotsTarget_Prev': team_stats[home_team]['ShotsTarget'] / team_stats[home_team]['MatchesPlayed'] if team_stats[home_team]['MatchesPlayed'] > 0 else 0,
+        f'Home_AvgCorners_Prev': team_stats[home_team]['Corners'] / team_stats[home_team]['MatchesPlayed'] if team_stats[home_team]['MatchesPlayed'] > 0 else 0,
+        f'Home_WinRatio_Prev': team_stats[home_team]['Wins'] / team_stats[home_team]['MatchesPlayed'] if team_stats[home_team]['MatchesPlayed'] > 0 else 0,
+        f'Home_DrawRatio_Prev': team_stats[home_team]['Draws'] / team_stats[home_team]['MatchesPlayed'] if team_stats[home_team]['MatchesPlayed'] > 0 else 0,
+        f'Home_LossRatio_Prev': team_stats[home_team]['Losses'] / team_stats[home_team]['MatchesPlayed'] if team_stats[home_team]['MatchesPlayed'] > 0 else 0,
+
+        # Forma reciente (últimos 5 partidos)
+        f'Home_Form_GoalsScored_Last5': sum(team_stats[home_team]['Last5GoalsScored']) / len(team_stats[home_team]['Last5GoalsScored']) if team_stats[home_team]['Last5GoalsScored'] else 0,
+        f'Home_Form_GoalsConceded_Last5': sum(team_stats[home_team]['Last5GoalsConceded']) / len(team_stats[home_team]['Last5GoalsConceded']) if team_stats[home_team]['Last5GoalsConceded'] else 0,
+        f'Home_Form_Wins_Last5': team_stats[home_team]['Last5Results'].count('W') / len(team_stats[home_team]['Last5Results']) if team_stats[home_team]['Last5Results'] else 0,
+        f'Home_Form_Draws_Last5': team_stats[home_team]['Last5Results'].count('D') / len(team_stats[home_team]['Last5Results']) if team_stats[home_team]['Last5Results'] else 0,
+        f'Home_Form_Losses_Last5': team_stats[home_team]['Last5Results'].count('L') / len(team_stats[home_team]['Last5Results']) if team_stats[home_team]['Last5Results'] else 0,
+
+        # Estadísticas específicas de jugar en casa
+        f'Home_HomeWinRatio_Prev': team_stats[home_team]['HomeWins'] / (team_stats[home_team]['HomeWins'] + team_stats[home_team]['HomeDraws'] + team_stats[home_team]['HomeLosses']) if (team_stats[home_team]['HomeWins'] + team_stats[home_team]['HomeDraws'] + team_stats[home_team]['HomeLosses']) > 0 else 0,
+        f'Home_HomeGoalsScored_Prev': team_stats[home_team]['HomeGoalsScored'] / (team_stats[home_team]['HomeWins'] + team_stats[home_team]['HomeDraws'] + team_stats[home_team]['HomeLosses']) if (team_stats[home_team]['HomeWins'] + team_stats[home_team]['HomeDraws'] + team_stats[home_team]['HomeLosses']) > 0 else 0,
+        f'Home_HomeGoalsConceded_Prev': team_stats[home_team]['HomeGoalsConceded'] / (team_stats[home_team]['HomeWins'] + team_stats[home_team]['HomeDraws'] + team_stats[home_team]['HomeLosses']) if (team_stats[home_team]['HomeWins'] + team_stats[home_team]['HomeDraws'] + team_stats[home_team]['HomeLosses']) > 0 else 0,
+    }
+
+    # --- Características del equipo visitante antes del partido ---
+    away_features = {
+        f'Away_AvgGoalsScored_Prev': team_stats[away_team]['GoalsScored'] / team_stats[away_team]['MatchesPlayed'] if team_stats[away_team]['MatchesPlayed'] > 0 else 0,
+        f'Away_AvgGoalsConceded_Prev': team_stats[away_team]['GoalsConceded'] / team_stats[away_team]['MatchesPlayed'] if team_stats[away_team]['MatchesPlayed'] > 0 else 0,
+        f'Away_AvgShotsTarget_Prev': team_stats[away_team]['ShotsTarget'] / team_stats[away_team]['MatchesPlayed'] if team_stats[away_team]['MatchesPlayed'] > 0 else 0,
+        f'Away_AvgCorners_Prev': team_stats[away_team]['Corners'] / team_stats[away_team]['MatchesPlayed'] if team_stats[away_team]['MatchesPlayed'] > 0 else 0,
+        f'Away_WinRatio_Prev': team_stats[away_team]['Wins'] / team_stats[away_team]['MatchesPlayed'] if team_stats[away_team]['MatchesPlayed'] > 0 else 0,
+        f'Away_DrawRatio_Prev': team_stats[away_team]['Draws'] / team_stats[away_team]['MatchesPlayed'] if team_stats[away_team]['MatchesPlayed'] > 0 else 0,
+        f'Away_LossRatio_Prev': team_stats[away_team]['Losses'] / team_stats[away_team]['MatchesPlayed'] if team_stats[away_team]['MatchesPlayed'] > 0 else 0,
+
+        # Forma reciente (últimos 5 partidos)
+        f'Away_Form_GoalsScored_Last5': sum(team_stats[away_team]['Last5GoalsScored']) / len(team_stats[away_team]['Last5GoalsScored']) if team_stats[away_team]['Last5GoalsScored'] else 0,
+        f'Away_Form_GoalsConceded_Last5': sum(team_stats[away_team]['Last5GoalsConceded']) / len(team_stats[away_team]['Last5GoalsConceded']) if team_stats[away_team]['Last5GoalsConceded'] else 0,
+        f'Away_Form_Wins_Last5': team_stats[away_team]['Last5Results'].count('W') / len(team_stats[away_team]['Last5Results']) if team_stats[away_team]['Last5Results'] else 0,
+        f'Away_Form_Draws_Last5': team_stats[away_team]['Last5Results'].count('D') / len(team_stats[away_team]['Last5Results']) if team_stats[away_team]['Last5Results'] else 0,
+        f'Away_Form_Losses_Last5': team_stats[away_team]['Last5Results'].count('L') / len(team_stats[away_team]['Last5Results']) if team_stats[away_team]['Last5Results'] else 0,
+
+        # Estadísticas específicas de jugar fuera de casa
+        f'Away_AwayWinRatio_Prev': team_stats[away_team]['AwayWins'] / (team_stats[away_team]['AwayWins'] + team_stats[away_team]['AwayDraws'] + team_stats[away_team]['AwayLosses']) if (team_stats[away_team]['AwayWins'] + team_stats[away_team]['AwayDraws'] + team_stats[away_team]['AwayLosses']) > 0 else 0,
+        f'Away_AwayGoalsScored_Prev': team_stats[away_team]['AwayGoalsScored'] / (team_stats[away_team]['AwayWins'] + team_stats[away_team]['AwayDraws'] + team_stats[away_team]['AwayLosses']) if (team_stats[away_team]['AwayWins'] + team_stats[away_team]['AwayDraws'] + team_stats[away_team]['AwayLosses']) > 0 else 0,
+        f'Away_AwayGoalsConceded_Prev': team_stats[away_team]['AwayGoalsConceded'] / (team_stats[away_team]['AwayWins'] + team_stats[away_team]['AwayDraws'] + team_stats[away_team]['AwayLosses']) if (team_stats[away_team]['AwayWins'] + team_stats[away_team]['AwayDraws'] + team_stats[away_team]['AwayLosses']) > 0 else 0,
+
+    }
+
+    # --- Crear características relativas entre equipos ---
+    relative_features = {
+        'GoalDifference_Prev': home_features['Home_AvgGoalsScored_Prev'] - away_features['Away_AvgGoalsConceded_Prev'],
+        'ShotsTargetDifference_Prev': home_features['Home_AvgShotsTarget_Prev'] - away_features['Away_AvgShotsTarget_Prev'],
+        'FormDifference_GoalsScored_Last5': home_features['Home_Form_GoalsScored_Last5'] - away_features['Away_Form_GoalsScored_Last5'],
+        'FormDifference_GoalsConceded_Last5': home_features['Home_Form_GoalsConceded_Last5'] - away_features['Away_Form_GoalsConceded_Last5'],
+        'FormDifference_Wins_Last5': home_features['Home_Form_Wins_Last5'] - away_features['Away_Form_Wins_Last5'],
+    }
+
+    # --- Características de enfrentamientos directos (H2H) antes del partido ---
+    h2h_features = get_h2h_features(h2h_index, home_team, away_team)
+
+    return {**home_features, **away_features, **relative_features, **h2h_features}
+
+def update_team_stats(team_stats, row):
+    """
+    Actualiza las estadísticas acumuladas de los dos equipos con el resultado de un partido jugado.
+
+    Args:
+        team_stats (dict): Estadísticas acumuladas por equipo (se modifica en el sitio).
+        row (pd.Series): Fila del partido con los datos brutos.
+    """
+    home_team = row['HomeTeam']
+    away_team = row['AwayTeam']
+
+    # Inicializar estadísticas para equipos si no existen
+    if home_team not in team_stats:
+        team_stats[home_team] = _new_team_stats()
+    if away_team not in team_stats:
+        team_stats[away_team] = _new_team_stats()
+
+    # --- Actualizar las estadísticas de los equipos DESPUÉS del partido ---
+    # Equipo Local
+    team_stats[home_team]['MatchesPlayed'] += 1
+    team_stats[home_team]['GoalsScored'] += row['FullTimeHomeGoals']
+    team_stats[home_team]['GoalsConceded'] += row['FullTimeAwayGoals']
+    team_stats[home_team]['ShotsTarget'] += row['HomeShotsTarget'] if 'HomeShotsTarget' in row else 0 # Añadir check por si la columna no existe
+    team_stats[home_team]['Corners'] += row['HomeCorners'] if 'HomeCorners' in row else 0
+    team_stats[home_team]['Fouls'] += row['HomeFouls'] if 'HomeFouls' in row else 0
+    team_stats[home_team]['YellowCards'] += row['HomeYellowCards'] if 'HomeYellowCards' in row else 0
+    team_stats[home_team]['RedCards'] += row['HomeRedCards'] if 'HomeRedCards' in row else 0
+
+    # Actualizar resultados para forma reciente (últimos 5 partidos)
+    team_stats[home_team]['Last5GoalsScored'].append(row['FullTimeHomeGoals'])
+    team_stats[home_team]['Last5GoalsConceded'].append(row['FullTimeAwayGoals'])
+    if row['FullTimeResult'] == 'H': # Home win
+        team_stats[home_team]['Wins'] += 1
+        team_stats[home_team]['HomeWins'] += 1
+        team_stats[home_team]['Last5Results'].append('W')
+    elif row['FullTimeResult'] == 'D': # Draw
+        team_stats[home_team]['Draws'] += 1
+        team_stats[home_team]['HomeDraws'] += 1
+        team_stats[home_team]['Last5Results'].append('D')
+    else: # Away win (Home Loss)
+        team_stats[home_team]['Losses'] += 1
+        team_stats[home_team]['HomeLosses'] += 1
+        team_stats[home_team]['Last5Results'].append('L')
+
+    # Mantener solo los últimos 5 resultados para la forma
+    if len(team_stats[home_team]['Last5GoalsScored']) > 5:
+        team_stats[home_team]['Last5GoalsScored'].pop(0)
+        team_stats[home_team]['Last5GoalsConceded'].pop(0)
+        team_stats[home_team]['Last5Results'].pop(0)
+
+    # Equipo Visitante
+    team_stats[away_team]['MatchesPlayed'] += 1
+    team_stats[away_team]['GoalsScored'] += row['FullTimeAwayGoals']
+    team_stats[away_team]['GoalsConceded'] += row['FullTimeHomeGoals']
+    team_stats[away_team]['ShotsTarget'] += row['AwayShotsTarget'] if 'AwayShotsTarget' in row else 0
+    team_stats[away_team]['Corners'] += row['AwayCorners'] if 'AwayCorners' in row else 0
+    team_stats[away_team]['Fouls'] += row['AwayFouls'] if 'AwayFouls' in row else 0
+    team_stats[away_team]['YellowCards'] += row['AwayYellowCards'] if 'AwayYellowCards' in row else 0
+    team_stats[away_team]['RedCards'] += row['AwayRedCards'] if 'AwayRedCards' in row else 0
+
+    # Actualizar resultados para forma reciente (últimos 5 partidos)
+    team_stats[away_team]['Last5GoalsScored'].append(row['FullTimeAwayGoals'])
+    team_stats[away_team]['Last5GoalsConceded'].append(row['FullTimeHomeGoals'])
+    if row['FullTimeResult'] == 'A': # Away win
+        team_stats[away_team]['Wins'] += 1
+        team_stats[away_team]['AwayWins'] += 1
+        team_stats[away_team]['Last5Results'].append('W')
+    elif row['FullTimeResult'] == 'D': # Draw
+        team_stats[away_team]['Draws'] += 1
+        team_stats[away_team]['AwayDraws'] += 1
+        team_stats[away_team]['Last5Results'].append('D')
+    else: # Home win (Away Loss)
+        team_stats[away_team]['Losses'] += 1
+        team_stats[away_team]['AwayLosses'] += 1
+        team_stats[away_team]['Last5Results'].append('L')
+
+    # Mantener solo los últimos 5 resultados para la forma
+    if len(team_stats[away_team]['Last5GoalsScored']) > 5:
+        team_stats[away_team]['Last5GoalsScored'].pop(0)
+        team_stats[away_team]['Last5GoalsConceded'].pop(0)
+        team_stats[away_team]['Last5Results'].pop(0)
+
+def build_team_state(df, team_stats=None, h2h_index=None):
+    """
+    Recorre los partidos una sola vez y devuelve el estado final de los equipos y el índice H2H,
+    listos para calcular las características de un partido futuro con get_match_features.
+    Se asume que el DataFrame ya está ordenado por fecha.
+
+    Args:
+        df (pd.DataFrame): DataFrame con los datos brutos de los partidos, ordenado por fecha.
+        team_stats (dict, opcional): Estado existente al que añadir los partidos.
+        h2h_index (dict, opcional): Índice H2H existente al que añadir los partidos.
+
+    Returns:
+        tuple: (team_stats, h2h_index)
+    """
+    if team_stats is None:
+        team_stats = {}
+    if h2h_index is None:
+        h2h_index = {}
+    for index, row in df.iterrows():
+        update_team_stats(team_stats, row)
+        update_h2h_index(h2h_index, row['HomeTeam'], row['AwayTeam'], row['FullTimeHomeGoals'], row['FullTimeAwayGoals'])
+    return team_stats, h2h_index
+
+def calculate_team_stats(df, team_stats=None, h2h_index=None):
     """
     Calcula estadísticas acumulativas y de forma para cada equipo antes de cada partido.
     Se asume que el DataFrame ya está ordenado por fecha.
 
     Args:
         df (pd.DataFrame): DataFrame con los datos brutos de los partidos, ordenado por fecha.
+        team_stats (dict, opcional): Si se pasa, al terminar queda con el estado final de cada equipo.
+        h2h_index (dict, opcional): Si se pasa, al terminar queda con todos los enfrentamientos de df.
+                                    Ambos permiten predecir después sin volver a recorrer el historial.
 
     Returns:
         pd.DataFrame: DataFrame con las nuevas características añadidas.
     """
     
-    # Inicializar DataFrames para almacenar estadísticas por equipo
     # Usaremos diccionarios para almacenar las estadísticas por equipo para un acceso rápido
-    team_stats = {} 
+    if team_stats is None:
+        team_stats = {}
+    # Índice de enfrentamientos directos por pareja de equipos (ver update_h2h_index)
+    if h2h_index is None:
+        h2h_index = {}
     
     # Columnas para las nuevas características
     features = []
@@ -26,80 +329,9 @@ def calculate_team_stats(df):
     for index, row in df.iterrows():
         home_team = row['HomeTeam']
         away_team = row['AwayTeam']
-        
-        # Inicializar estadísticas para equipos si no existen
-        if home_team not in team_stats:
-            team_stats[home_team] = {
-                'MatchesPlayed': 0, 'GoalsScored': 0, 'GoalsConceded': 0, 'ShotsTarget': 0,
-                'Corners': 0, 'Fouls': 0, 'YellowCards': 0, 'RedCards': 0, 'Wins': 0, 'Draws': 0, 'Losses': 0,
-                'Last5GoalsScored': [], 'Last5GoalsConceded': [], 'Last5Results': [],
-                'HomeGoalsScored': 0, 'HomeGoalsConceded': 0, 'HomeWins': 0, 'HomeDraws': 0, 'HomeLosses': 0,
-                'AwayGoalsScored': 0, 'AwayGoalsConceded': 0, 'AwayWins': 0, 'AwayDraws': 0, 'AwayLosses': 0,
-            }
-        if away_team not in team_stats:
-            team_stats[away_team] = {
-                'MatchesPlayed': 0, 'GoalsScored': 0, 'GoalsConceded': 0, 'ShotsTarget': 0,
-                'Corners': 0, 'Fouls': 0, 'YellowCards': 0, 'RedCards': 0, 'Wins': 0, 'Draws': 0, 'Losses': 0,
-                'Last5GoalsScored': [], 'Last5GoalsConceded': [], 'Last5Results': [],
-                'HomeGoalsScored': 0, 'HomeGoalsConceded': 0, 'HomeWins': 0, 'HomeDraws': 0, 'HomeLosses': 0,
-                'AwayGoalsScored': 0, 'AwayGoalsConceded': 0, 'AwayWins': 0, 'AwayDraws': 0, 'AwayLosses': 0,
-            }
-
-        # --- Características del equipo local antes del partido ---
-        home_features = {
-            f'Home_AvgGoalsScored_Prev': team_stats[home_team]['GoalsScored'] / team_stats[home_team]['MatchesPlayed'] if team_stats[home_team]['MatchesPlayed'] > 0 else 0,
-            f'Home_AvgGoalsConceded_Prev': team_stats[home_team]['GoalsConceded'] / team_stats[home_team]['MatchesPlayed'] if team_stats[home_team]['MatchesPlayed'] > 0 else 0,
-            f'Home_AvgShotsTarget_Prev': team_stats[home_team]['ShotsTarget'] / team_stats[home_team]['MatchesPlayed'] if team_stats[home_team]['MatchesPlayed'] > 0 else 0,
-            f'Home_AvgCorners_Prev': team_stats[home_team]['Corners'] / team_stats[home_team]['MatchesPlayed'] if team_stats[home_team]['MatchesPlayed'] > 0 else 0,
-            f'Home_WinRatio_Prev': team_stats[home_team]['Wins'] / team_stats[home_team]['MatchesPlayed'] if team_stats[home_team]['MatchesPlayed'] > 0 else 0,
-            f'Home_DrawRatio_Prev': team_stats[home_team]['Draws'] / team_stats[home_team]['MatchesPlayed'] if team_stats[home_team]['MatchesPlayed'] > 0 else 0,
-            f'Home_LossRatio_Prev': team_stats[home_team]['Losses'] / team_stats[home_team]['MatchesPlayed'] if team_stats[home_team]['MatchesPlayed'] > 0 else 0,
-            
-            # Forma reciente (últimos 5 partidos)
-            f'Home_Form_GoalsScored_Last5': sum(team_stats[home_team]['Last5GoalsScored']) / len(team_stats[home_team]['Last5GoalsScored']) if team_stats[home_team]['Last5GoalsScored'] else 0,
-            f'Home_Form_GoalsConceded_Last5': sum(team_stats[home_team]['Last5GoalsConceded']) / len(team_stats[home_team]['Last5GoalsConceded']) if team_stats[home_team]['Last5GoalsConceded'] else 0,
-            f'Home_Form_Wins_Last5': team_stats[home_team]['Last5Results'].count('W') / len(team_stats[home_team]['Last5Results']) if team_stats[home_team]['Last5Results'] else 0,
-            f'Home_Form_Draws_Last5': team_stats[home_team]['Last5Results'].count('D') / len(team_stats[home_team]['Last5Results']) if team_stats[home_team]['Last5Results'] else 0,
-            f'Home_Form_Losses_Last5': team_stats[home_team]['Last5Results'].count('L') / len(team_stats[home_team]['Last5Results']) if team_stats[home_team]['Last5Results'] else 0,
-
-            # Estadísticas específicas de jugar en casa
-            f'Home_HomeWinRatio_Prev': team_stats[home_team]['HomeWins'] / (team_stats[home_team]['HomeWins'] + team_stats[home_team]['HomeDraws'] + team_stats[home_team]['HomeLosses']) if (team_stats[home_team]['HomeWins'] + team_stats[home_team]['HomeDraws'] + team_stats[home_team]['HomeLosses']) > 0 else 0,
-            f'Home_HomeGoalsScored_Prev': team_stats[home_team]['HomeGoalsScored'] / (team_stats[home_team]['HomeWins'] + team_stats[home_team]['HomeDraws'] + team_stats[home_team]['HomeLosses']) if (team_stats[home_team]['HomeWins'] + team_stats[home_team]['HomeDraws'] + team_stats[home_team]['HomeLosses']) > 0 else 0,
-            f'Home_HomeGoalsConceded_Prev': team_stats[home_team]['HomeGoalsConceded'] / (team_stats[home_team]['HomeWins'] + team_stats[home_team]['HomeDraws'] + team_stats[home_team]['HomeLosses']) if (team_stats[home_team]['HomeWins'] + team_stats[home_team]['HomeDraws'] + team_stats[home_team]['HomeLosses']) > 0 else 0,
-        }
-        
-        # --- Características del equipo visitante antes del partido ---
-        away_features = {
-            f'Away_AvgGoalsScored_Prev': team_stats[away_team]['GoalsScored'] / team_stats[away_team]['MatchesPlayed'] if team_stats[away_team]['MatchesPlayed'] > 0 else 0,
-            f'Away_AvgGoalsConceded_Prev': team_stats[away_team]['GoalsConceded'] / team_stats[away_team]['MatchesPlayed'] if team_stats[away_team]['MatchesPlayed'] > 0 else 0,
-            f'Away_AvgShotsTarget_Prev': team_stats[away_team]['ShotsTarget'] / team_stats[away_team]['MatchesPlayed'] if team_stats[away_team]['MatchesPlayed'] > 0 else 0,
-            f'Away_AvgCorners_Prev': team_stats[away_team]['Corners'] / team_stats[away_team]['MatchesPlayed'] if team_stats[away_team]['MatchesPlayed'] > 0 else 0,
-            f'Away_WinRatio_Prev': team_stats[away_team]['Wins'] / team_stats[away_team]['MatchesPlayed'] if team_stats[away_team]['MatchesPlayed'] > 0 else 0,
-            f'Away_DrawRatio_Prev': team_stats[away_team]['Draws'] / team_stats[away_team]['MatchesPlayed'] if team_stats[away_team]['MatchesPlayed'] > 0 else 0,
-            f'Away_LossRatio_Prev': team_stats[away_team]['Losses'] / team_stats[away_team]['MatchesPlayed'] if team_stats[away_team]['MatchesPlayed'] > 0 else 0,
-
-            # Forma reciente (últimos 5 partidos)
-            f'Away_Form_GoalsScored_Last5': sum(team_stats[away_team]['Last5GoalsScored']) / len(team_stats[away_team]['Last5GoalsScored']) if team_stats[away_team]['Last5GoalsScored'] else 0,
-            f'Away_Form_GoalsConceded_Last5': sum(team_stats[away_team]['Last5GoalsConceded']) / len(team_stats[away_team]['Last5GoalsConceded']) if team_stats[away_team]['Last5GoalsConceded'] else 0,
-            f'Away_Form_Wins_Last5': team_stats[away_team]['Last5Results'].count('W') / len(team_stats[away_team]['Last5Results']) if team_stats[away_team]['Last5Results'] else 0,
-            f'Away_Form_Draws_Last5': team_stats[away_team]['Last5Results'].count('D') / len(team_stats[away_team]['Last5Results']) if team_stats[away_team]['Last5Results'] else 0,
-            f'Away_Form_Losses_Last5': team_stats[away_team]['Last5Results'].count('L') / len(team_stats[away_team]['Last5Results']) if team_stats[away_team]['Last5Results'] else 0,
-
-            # Estadísticas específicas de jugar fuera de casa
-            f'Away_AwayWinRatio_Prev': team_stats[away_team]['AwayWins'] / (team_stats[away_team]['AwayWins'] + team_stats[away_team]['AwayDraws'] + team_stats[away_team]['AwayLosses']) if (team_stats[away_team]['AwayWins'] + team_stats[away_team]['AwayDraws'] + team_stats[away_team]['AwayLosses']) > 0 else 0,
-            f'Away_AwayGoalsScored_Prev': team_stats[away_team]['AwayGoalsScored'] / (team_stats[away_team]['AwayWins'] + team_stats[away_team]['AwayDraws'] + team_stats[away_team]['AwayLosses']) if (team_stats[away_team]['AwayWins'] + team_stats[away_team]['AwayDraws'] + team_stats[away_team]['AwayLosses']) > 0 else 0,
-            f'Away_AwayGoalsConceded_Prev': team_stats[away_team]['AwayGoalsConceded'] / (team_stats[away_team]['AwayWins'] + team_stats[away_team]['AwayDraws'] + team_stats[away_team]['AwayLosses']) if (team_stats[away_team]['AwayWins'] + team_stats[away_team]['AwayDraws'] + team_stats[away_team]['AwayLosses']) > 0 else 0,
 
-        }
-
-        # --- Crear características relativas entre equipos ---
-        relative_features = {
-            'GoalDifference_Prev': home_features['Home_AvgGoalsScored_Prev'] - away_features['Away_AvgGoalsConceded_Prev'],
-            'ShotsTargetDifference_Prev': home_features['Home_AvgShotsTarget_Prev'] - away_features['Away_AvgShotsTarget_Prev'],
-            'FormDifference_GoalsScored_Last5': home_features['Home_Form_GoalsScored_Last5'] - away_features['Away_Form_GoalsScored_Last5'],
-            'FormDifference_GoalsConceded_Last5': home_features['Home_Form_GoalsConceded_Last5'] - away_features['Away_Form_GoalsConceded_Last5'],
-            'FormDifference_Wins_Last5': home_features['Home_Form_Wins_Last5'] - away_features['Away_Form_Wins_Last5'],
-        }
+        # Características del partido con las estadísticas ANTERIORES a él
+        match_features = get_match_features(team_stats, h2h_index, home_team, away_team)
 
         # Combina todas las características para este partido
         current_features = {
@@ -107,77 +339,12 @@ def calculate_team_stats(df):
             'AwayTeam': away_team,
             'Date': row['Date'],
             'FullTimeResult': row['FullTimeResult'], # Mantener el resultado para el target
-            **home_features,
-            **away_features,
-            **relative_features
+            **match_features
         }
         features.append(current_features)
 
-        # --- Actualizar las estadísticas de los equipos DESPUÉS del partido ---
-        # Equipo Local
-        team_stats[home_team]['MatchesPlayed'] += 1
-        team_stats[home_team]['GoalsScored'] += row['FullTimeHomeGoals']
-        team_stats[home_team]['GoalsConceded'] += row['FullTimeAwayGoals']
-        team_stats[home_team]['ShotsTarget'] += row['HomeShotsTarget'] if 'HomeShotsTarget' in row else 0 # Añadir check por si la columna no existe
-        team_stats[home_team]['Corners'] += row['HomeCorners'] if 'HomeCorners' in row else 0
-        team_stats[home_team]['Fouls'] += row['HomeFouls'] if 'HomeFouls' in row else 0
-        team_stats[home_team]['YellowCards'] += row['HomeYellowCards'] if 'HomeYellowCards' in row else 0
-        team_stats[home_team]['RedCards'] += row['HomeRedCards'] if 'HomeRedCards' in row else 0
-
-        # Actualizar resultados para forma reciente (últimos 5 partidos)
-        team_stats[home_team]['Last5GoalsScored'].append(row['FullTimeHomeGoals'])
-        team_stats[home_team]['Last5GoalsConceded'].append(row['FullTimeAwayGoals'])
-        if row['FullTimeResult'] == 'H': # Home win
-            team_stats[home_team]['Wins'] += 1
-            team_stats[home_team]['HomeWins'] += 1
-            team_stats[home_team]['Last5Results'].append('W')
-        elif row['FullTimeResult'] == 'D': # Draw
-            team_stats[home_team]['Draws'] += 1
-            team_stats[home_team]['HomeDraws'] += 1
-            team_stats[home_team]['Last5Results'].append('D')
-        else: # Away win (Home Loss)
-            team_stats[home_team]['Losses'] += 1
-            team_stats[home_team]['HomeLosses'] += 1
-            team_stats[home_team]['Last5Results'].append('L')
-
-        # Mantener solo los últimos 5 resultados para la forma
-        if len(team_stats[home_team]['Last5GoalsScored']) > 5:
-            team_stats[home_team]['Last5GoalsScored'].pop(0)
-            team_stats[home_team]['Last5GoalsConceded'].pop(0)
-            team_stats[home_team]['Last5Results'].pop(0)
-
-        # Equipo Visitante
-        team_stats[away_team]['MatchesPlayed'] += 1
-        team_stats[away_team]['GoalsScored'] += row['FullTimeAwayGoals']
-        team_stats[away_team]['GoalsConceded'] += row['FullTimeHomeGoals']
-        team_stats[away_team]['ShotsTarget'] += row['AwayShotsTarget'] if 'AwayShotsTarget' in row else 0
-        team_stats[away_team]['Corners'] += row['AwayCorners'] if 'AwayCorners' in row else 0
-        team_stats[away_team]['Fouls'] += row['AwayFouls'] if 'AwayFouls' in row else 0
-        team_stats[away_team]['YellowCards'] += row['AwayYellowCards'] if 'AwayYellowCards' in row else 0
-        team_stats[away_team]['RedCards'] += row['AwayRedCards'] if 'AwayRedCards' in row else 0
-
-        # Actualizar resultados para forma reciente (últimos 5 partidos)
-        team_stats[away_team]['Last5GoalsScored'].append(row['FullTimeAwayGoals'])
-        team_stats[away_team]['Last5GoalsConceded'].append(row['FullTimeHomeGoals'])
-        if row['FullTimeResult'] == 'A': # Away win
-            team_stats[away_team]['Wins'] += 1
-            team_stats[away_team]['AwayWins'] += 1
-            team_stats[away_team]['Last5Results'].append('W')
-        elif row['FullTimeResult'] == 'D': # Draw
-            team_stats[away_team]['Draws'] += 1
-            team_stats[away_team]['AwayDraws'] += 1
-            team_stats[away_team]['Last5Results'].append('D')
-        else: # Home win (Away Loss)
-            team_stats[away_team]['Losses'] += 1
-            team_stats[away_team]['AwayLosses'] += 1
-            team_stats[away_team]['Last5Results'].append('L')
-
-        # Mantener solo los últimos 5 resultados para la forma
-        if len(team_stats[away_team]['Last5GoalsScored']) > 5:
-            team_stats[away_team]['Last5GoalsScored'].pop(0)
-            team_stats[away_team]['Last5GoalsConceded'].pop(0)
-            team_stats[away_team]['Last5Results'].pop(0)
+        # --- Actualizar las estadísticas DESPUÉS del partido ---
+        update_team_stats(team_stats, row)
+        update_h2h_index(h2h_index, home_team, away_team, row['FullTimeHomeGoals'], row['FullTimeAwayGoals'])
             
     return pd.DataFrame(features)
-
-
@@ -4,10 +4,10 @@ import os
 import pandas as pd # Aunque pandas se usa en los módulos, a veces es útil aquí para manipulación si se necesita.
 
 # Importar funciones de nuestros módulos
-from data_loader import load_all_league_data
+from data_loader import load_league_data
 from feature_engineer import calculate_team_stats
 from model_trainer import train_and_evaluate_model
-from predictor import load_model_and_encoder, make_prediction_for_match
+from predictor import load_model_and_encoder, make_prediction_for_match, get_model_feature_mismatch
 
 # Lista de características a excluir, necesaria para la preparación de datos en el backtesting
 # Esta lista debe ser la misma que la usada en model_trainer.py para consistencia.
@@ -34,8 +34,10 @@ if __name__ == "__main__":
 
     # 2. Cargar los datos históricos de los partidos
     # Aquí cargamos los CSVs que descargaste de Football-Data.org
+    # Los CSV se ingieren en un dataset particionado por liga y temporada (se reingieren si
+    # alguno ha cambiado); las cargas solo leen las particiones que necesitan.
     print("\n2. Cargando datos históricos de la Premier League (E0)...")
-    df_raw = load_all_league_data(data_folder=data_folder, league_prefix='E0')
+    df_raw = load_league_data(data_folder=data_folder, league_prefix='E0')
     if df_raw.empty:
         print("Error: No se cargaron datos. Revisa tus archivos CSV en la carpeta 'data'.")
         exit()
@@ -44,7 +46,10 @@ if __name__ == "__main__":
     # 3. Ingeniería de Características: Transformar datos brutos en información útil
     # Esto es donde calculamos promedios, formas, etc., de los equipos antes de cada partido.
     print("\n3. Realizando Ingeniería de Características (esto puede tardar)...")
-    df_features = calculate_team_stats(df_raw.copy()) 
+    # El estado de los equipos y el índice H2H quedan acumulados con todo el historial
+    # y se reutilizan en las predicciones sin volver a recorrerlo
+    team_stats, h2h_index = {}, {}
+    df_features = calculate_team_stats(df_raw.copy(), team_stats=team_stats, h2h_index=h2h_index) 
     # Eliminamos las primeras filas que tienen NaN debido a la falta de historial para calcular las características iniciales
     df_features.dropna(subset=[col for col in df_features.columns if col not in ['HomeTeam', 'AwayTeam', 'Date', 'FullTimeResult']], inplace=True)
     if df_features.empty:
@@ -60,8 +65,17 @@ if __name__ == "__main__":
         encoder_path=os.path.join(models_folder, 'label_encoder.joblib')
     )
     
+    # Si el modelo guardado se entrenó con otras características (ej. antes de añadir las H2H), lo reentrenamos
+    if trained_model is not None:
+        current_feature_cols = [col for col in df_features.columns if col not in features_to_exclude]
+        unknown_cols, missing_cols = get_model_feature_mismatch(trained_model, current_feature_cols)
+        if unknown_cols or missing_cols:
+            print(f"El modelo guardado no coincide con las características actuales (nuevas: {unknown_cols}, eliminadas: {missing_cols}).")
+            print("Procediendo a reentrenar el modelo.")
+            trained_model = None
+
     if trained_model is None: # Si el modelo no se cargó, lo entrenamos
-        print("Modelo no encontrado. Procediendo a entrenar un nuevo modelo.")
+        print("Modelo no encontrado o desactualizado. Procediendo a entrenar un nuevo modelo.")
         trained_model, label_encoder = train_and_evaluate_model(df_features)
         if trained_model is None: 
             print("Error: No se pudo entrenar el modelo. Saliendo.")
@@ -132,6 +146,6 @@ if __name__ == "__main__":
     # Llamamos a la función de predicción. Le pasamos el df_raw COMPLETO
     # para que las características de Man Utd y Liverpool se calculen basándose
     # en todo el historial disponible hasta el momento.
-    make_prediction_for_match(home_team_future, away_team_future, df_raw.copy(), trained_model, label_encoder)
+    make_prediction_for_match(home_team_future, away_team_future, df_raw.copy(), trained_model, label_encoder, team_state=(team_stats, h2h_index))
 
     print("\n--- Proceso de Pronósticos de Fútbol completado. ---")
\ No newline at end of file
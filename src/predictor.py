@@ -9,7 +9,7 @@ import sys
 # Añadir la ruta de src al path para poder importar data_loader y feature_engineer
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
 from data_loader import load_all_league_data
-from feature_engineer import calculate_team_stats
+from feature_engineer import build_team_state, get_match_features
 
 # Definir las columnas a excluir aquí también, para que predictor.py sea autocontenido
 # Esta lista debe ser la misma que la usada en model_trainer.py y main.py
@@ -32,7 +32,23 @@ def load_model_and_encoder(model_path='../models/xgboost_football_predictor.jobl
         print("Error: Modelo o LabelEncoder no encontrados. Asegúrate de haberlos entrenado y guardado.")
         return None, None
 
-def make_prediction_for_match(home_team, away_team, current_data_df, trained_model, label_encoder):
+def get_model_feature_mismatch(trained_model, feature_cols):
+    """
+    Compara las columnas con las que se entrenó el modelo con las que genera ahora
+    calculate_team_stats.
+
+    Returns:
+        tuple: (columnas que el modelo no conoce, columnas que el modelo espera y ya no existen).
+               Ambas listas vacías si el modelo está al día o no guarda sus columnas.
+    """
+    if not hasattr(trained_model, 'feature_names_in_'):
+        return [], []
+    model_cols = list(trained_model.feature_names_in_)
+    unknown_cols = [col for col in feature_cols if col not in model_cols]
+    missing_cols = [col for col in model_cols if col not in feature_cols]
+    return unknown_cols, missing_cols
+
+def make_prediction_for_match(home_team, away_team, current_data_df, trained_model, label_encoder, team_state=None):
     """
     Genera un pronóstico para un partido futuro basándose en las estadísticas actuales.
 
@@ -45,46 +61,40 @@ def make_prediction_for_match(home_team, away_team, current_data_df, trained_mod
                                         anteriores para calcular las estadísticas de forma.
         trained_model: El modelo de ML entrenado.
         label_encoder: El LabelEncoder usado para codificar las etiquetas.
+        team_state (tuple, opcional): (team_stats, h2h_index) ya acumulados sobre current_data_df
+                                      (ver build_team_state). Si se pasa, la predicción no recorre
+                                      el historial; si no, se construye aquí en una sola pasada.
 
     Returns:
         dict: Un diccionario con las probabilidades de H, D, A.
     """
 
-    # Asegúrate de que el DataFrame de datos actuales esté ordenado por fecha
-    current_data_df = current_data_df.sort_values(by='Date').reset_index(drop=True)
-
-    # Crea un DataFrame temporal para calcular las características del partido.
-    # Añadimos el partido actual con resultados dummy (0,0,D) temporalmente
-    # Solo para que calculate_team_stats pueda iterar sobre él y calcular las stats PREVIAS
-    # Las stats reales del partido no se usarán para la predicción, solo para la actualización posterior
-    dummy_match = pd.DataFrame([{
-        'HomeTeam': home_team, 'AwayTeam': away_team, 'Date': pd.to_datetime('2099-01-01'), # Fecha futura para asegurar que va al final
-        'FullTimeHomeGoals': 0, 'FullTimeAwayGoals': 0, 'FullTimeResult': 'D', # Dummy results
-        'HomeShotsTarget': 0, 'AwayShotsTarget': 0, 'HomeCorners': 0, 'AwayCorners': 0,
-        'HomeFouls': 0, 'AwayFouls': 0, 'HomeYellowCards': 0, 'AwayYellowCards': 0,
-        'HomeRedCards': 0, 'AwayRedCards': 0
-    }])
-
-    # Unir los datos históricos con el partido "futuro" para calcular las características
-    # Es crucial que el partido futuro sea el ÚLTIMO en el DataFrame para que las estadísticas
-    # de los equipos se calculen correctamente hasta ese momento.
-    combined_df = pd.concat([current_data_df, dummy_match], ignore_index=True)
-
-    # Calcular las características para todos los partidos, incluyendo el "futuro"
-    # El bucle de calculate_team_stats se encargará de calcular las características
-    # del partido dummy basándose en los datos anteriores.
-    features_df = calculate_team_stats(combined_df.copy())
-
-    # Extraer las características del último partido (el partido futuro) como una Serie.
-    # Usamos .iloc[-1] para obtener la última fila como una Serie.
-    # Luego, eliminamos las columnas que no son características predictivas usando 'drop' con 'labels'.
-    # La lista 'features_to_exclude' debe estar disponible (la hemos definido al principio del archivo).
-    match_features_series = features_df.iloc[-1].drop(labels=[col for col in features_to_exclude if col in features_df.columns], errors='ignore')
-
-    # Para asegurar que 'expected_feature_cols' esté disponible aquí.
+    if team_state is None:
+        # Asegúrate de que el DataFrame de datos actuales esté ordenado por fecha
+        current_data_df = current_data_df.sort_values(by='Date').reset_index(drop=True)
+        team_state = build_team_state(current_data_df)
+    team_stats, h2h_index = team_state
+
+    # Las características del partido futuro salen directamente del estado acumulado de los
+    # equipos y del índice H2H: son las mismas que calculate_team_stats daría a un partido
+    # añadido al final del historial.
+    match_features_series = pd.Series(get_match_features(team_stats, h2h_index, home_team, away_team))
+
     # Es la lista de columnas que el modelo espera en la entrada (las mismas que X_train).
-    # Se puede obtener de las columnas de 'features_df' después de quitar las excluidas.
-    expected_feature_cols = [col for col in features_df.columns if col not in features_to_exclude]
+    expected_feature_cols = [col for col in match_features_series.index if col not in features_to_exclude]
+    # Si el modelo se entrenó con otras columnas, la predicción no usará todas las características.
+    # Avisamos claramente: hay que reentrenar (main.py lo hace automáticamente).
+    unknown_cols, missing_cols = get_model_feature_mismatch(trained_model, expected_feature_cols)
+    if unknown_cols or missing_cols:
+        print("\n" + "!" * 70)
+        print("ADVERTENCIA: El modelo cargado no coincide con las características actuales.")
+        if unknown_cols:
+            print(f"  Características que el modelo ignorará: {unknown_cols}")
+        if missing_cols:
+            print(f"  Características del modelo que se rellenarán con 0: {missing_cols}")
+        print("  Reentrena el modelo ejecutando 'python src/main.py'.")
+        print("!" * 70)
+        expected_feature_cols = list(trained_model.feature_names_in_)
 
     # Asegurarse de que las columnas estén en el orden correcto y rellenar NaN si hay alguna característica faltante.
     # Convertimos la Serie 'match_features_series' a un DataFrame de una sola fila,
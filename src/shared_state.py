@@ -0,0 +1,417 @@
+# src/shared_state.py
+
+import json
+import os
+import pickle
+import signal
+import struct
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from data_loader import load_league_data
+from feature_engineer import H2H_LAST_N, _h2h_key, _new_team_stats, build_team_state
+from predictor import load_model_and_encoder
+
+# Prefijo por defecto de los segmentos de memoria compartida
+SHARED_STATE_PREFIX = 'football_ai'
+
+# Cada cuántos segundos el proceso cargador comprueba si los CSV o el modelo han cambiado
+REFRESH_CHECK_INTERVAL_SECONDS = 60
+
+# Rutas que lee el proceso cargador (relativas a la raíz del proyecto, como app.py)
+DATA_FOLDER = 'data'
+MODEL_PATH = 'models/xgboost_football_predictor.joblib'
+ENCODER_PATH = 'models/label_encoder.joblib'
+
+# Segmento de control: época del cargador (cambia en cada arranque) y versión publicada
+_CONTROL_FORMAT = '<qq'
+_CONTROL_SIZE = struct.calcsize(_CONTROL_FORMAT)
+
+# Contadores escalares de cada equipo (columnas de la matriz 'team_counters')
+_TEAM_COUNTERS = [key for key, value in _new_team_stats().items() if not isinstance(value, list)]
+# Resultados de la forma reciente codificados como int8 (-1 = hueco sin partido)
+_FORM_RESULT_CODES = {'W': 0, 'D': 1, 'L': 2}
+_FORM_RESULTS = {code: result for result, code in _FORM_RESULT_CODES.items()}
+# Columnas de la matriz 'h2h_counters'; 'A' y 'B' son el primer y segundo equipo de la clave de la pareja
+_H2H_COUNTERS = ['Matches', 'Draws', 'GoalDiff', 'WinsA', 'WinsB',
+                 'VenueA_Matches', 'VenueA_Wins', 'VenueA_GoalDiff',
+                 'VenueB_Matches', 'VenueB_Wins', 'VenueB_GoalDiff']
+# Ganador de cada enfrentamiento reciente: 0 = equipo A, 1 = equipo B, 2 = empate, -1 = hueco
+_H2H_DRAW_CODE = 2
+
+def _control_name(prefix):
+    return f'{prefix}_ctl'
+
+def _data_name(prefix, epoch, version):
+    return f'{prefix}_{epoch:x}_v{version}'
+
+def _manifest_name(prefix, epoch, version):
+    return f'{prefix}_{epoch:x}_v{version}_mf'
+
+def _attach_segment(name):
+    """
+    Se conecta a un segmento existente sin que el resource_tracker de este proceso
+    lo borre al salir (solo el proceso cargador es dueño de los segmentos).
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False) # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+def _unlink_segment(name):
+    """Borra un segmento si existe (restos de un cargador que terminó sin limpiar)."""
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+def _read_control(prefix):
+    """
+    Abre el segmento de control por nombre y devuelve (época, versión).
+    Se reabre en cada consulta: si el cargador se reinicia, el segmento anterior
+    se borra y hay que leer el nuevo, no el que teníamos mapeado.
+    """
+    control_shm = _attach_segment(_control_name(prefix))
+    try:
+        return struct.unpack(_CONTROL_FORMAT, bytes(control_shm.buf[:_CONTROL_SIZE]))
+    finally:
+        control_shm.close()
+
+def _to_float(value):
+    """Convierte un contador a float; los NA de pandas (tipos Int64, boolean...) pasan a NaN."""
+    return np.nan if pd.isna(value) else float(value)
+
+def _team_state_to_arrays(team_stats, h2h_index):
+    """
+    Convierte el estado final de los equipos y el índice H2H (ver build_team_state) en
+    arrays numéricos de tamaño fijo que se pueden publicar en memoria compartida.
+
+    Returns:
+        tuple: (lista de equipos, diccionario nombre -> np.ndarray)
+    """
+    teams = sorted(team_stats)
+    team_positions = {team: i for i, team in enumerate(teams)}
+    form_window = max([len(stats['Last5Results']) for stats in team_stats.values()] + [1])
+
+    team_counters = np.full((len(teams), len(_TEAM_COUNTERS)), np.nan, dtype=np.float64)
+    form_goals_scored = np.full((len(teams), form_window), np.nan, dtype=np.float64)
+    form_goals_conceded = np.full((len(teams), form_window), np.nan, dtype=np.float64)
+    form_results = np.full((len(teams), form_window), -1, dtype=np.int8)
+    for team, i in team_positions.items():
+        stats = team_stats[team]
+        team_counters[i] = [_to_float(stats[key]) for key in _TEAM_COUNTERS]
+        n = len(stats['Last5Results'])
+        form_goals_scored[i, :n] = [_to_float(v) for v in stats['Last5GoalsScored']]
+        form_goals_conceded[i, :n] = [_to_float(v) for v in stats['Last5GoalsConceded']]
+        form_results[i, :n] = [_FORM_RESULT_CODES[r] for r in stats['Last5Results']]
+
+    pairs = sorted(h2h_index)
+    h2h_pairs = np.zeros((len(pairs), 2), dtype=np.int32)
+    h2h_counters = np.zeros((len(pairs), len(_H2H_COUNTERS)), dtype=np.float64)
+    h2h_last_results = np.full((len(pairs), H2H_LAST_N), -1, dtype=np.int8)
+    for i, (team_a, team_b) in enumerate(pairs):
+        pair_stats = h2h_index[(team_a, team_b)]
+        venue_a, venue_b = pair_stats['Venue'][team_a], pair_stats['Venue'][team_b]
+        h2h_pairs[i] = [team_positions[team_a], team_positions[team_b]]
+        h2h_counters[i] = [_to_float(v) for v in (
+            pair_stats['Matches'], pair_stats['Draws'], pair_stats['GoalDiff'],
+            pair_stats['Wins'][team_a], pair_stats['Wins'][team_b],
+            venue_a['Matches'], venue_a['Wins'], venue_a['GoalDiff'],
+            venue_b['Matches'], venue_b['Wins'], venue_b['GoalDiff'],
+        )]
+        last_results = pair_stats['LastResults']
+        h2h_last_results[i, :len(last_results)] = [
+            0 if winner == team_a else 1 if winner == team_b else _H2H_DRAW_CODE for winner in last_results
+        ]
+
+    return teams, {
+        'team_counters': team_counters,
+        'form_goals_scored': form_goals_scored,
+        'form_goals_conceded': form_goals_conceded,
+        'form_results': form_results,
+        'h2h_pairs': h2h_pairs,
+        'h2h_counters': h2h_counters,
+        'h2h_last_results': h2h_last_results,
+    }
+
+def publish_shared_state(team_stats, h2h_index, model, label_encoder, prefix=SHARED_STATE_PREFIX, published=None):
+    """
+    Publica el estado final de los equipos, el índice H2H, el esquema de características
+    y el modelo serializado en memoria compartida con un número de versión. Los workers
+    se conectan con attach_shared_state sin leer los CSV, recorrer el historial ni abrir
+    el archivo joblib.
+
+    Args:
+        team_stats (dict): Estadísticas acumuladas por equipo (ver build_team_state).
+        h2h_index (dict): Índice H2H acumulado (ver build_team_state).
+        model: El modelo de ML entrenado.
+        label_encoder: El LabelEncoder usado para codificar las etiquetas.
+        prefix (str): Prefijo de los nombres de los segmentos.
+        published (dict, opcional): Resultado de la publicación anterior, para reemplazarla.
+
+    Returns:
+        dict: Estado de la publicación ('epoch', 'version', 'control', 'segments'), necesario para
+              la siguiente publicación y para liberar los segmentos con release_shared_state.
+    """
+    if published is not None:
+        control_shm = published['control']
+        epoch = published['epoch']
+        version = published['version'] + 1
+    else:
+        try:
+            control_shm = shared_memory.SharedMemory(name=_control_name(prefix), create=True, size=_CONTROL_SIZE)
+        except FileExistsError:
+            # Un cargador anterior terminó sin limpiar: reutilizamos el control con una época nueva
+            # y borramos los segmentos que dejó (la versión publicada y la que pudiera estar escribiendo)
+            control_shm = shared_memory.SharedMemory(name=_control_name(prefix))
+            old_epoch, old_version = struct.unpack(_CONTROL_FORMAT, bytes(control_shm.buf[:_CONTROL_SIZE]))
+            for stale_version in (old_version, old_version + 1):
+                _unlink_segment(_data_name(prefix, old_epoch, stale_version))
+                _unlink_segment(_manifest_name(prefix, old_epoch, stale_version))
+        # Identifica este arranque del cargador (milisegundos, recortado para nombres de segmento cortos)
+        epoch = time.time_ns() // 1_000_000 % (1 << 40)
+        version = 1
+
+    teams, arrays = _team_state_to_arrays(team_stats, h2h_index)
+
+    entries = []
+    offset = 0
+    for name, values in arrays.items():
+        # Solo tipos numéricos de tamaño fijo: un array de objetos escribiría punteros, no datos
+        if values.dtype.kind not in 'biuf':
+            raise TypeError(f"El array '{name}' tiene tipo {values.dtype} y no se puede publicar en memoria compartida.")
+        # Alineamos cada array a 8 bytes para poder crear vistas directamente sobre el buffer
+        offset = (offset + 7) // 8 * 8
+        entries.append({'name': name, 'dtype': values.dtype.str, 'shape': list(values.shape), 'offset': offset})
+        offset += values.nbytes
+
+    model_bytes = pickle.dumps((model, label_encoder), protocol=pickle.HIGHEST_PROTOCOL)
+    model_offset = offset
+
+    feature_columns = list(model.feature_names_in_) if hasattr(model, 'feature_names_in_') else None
+    manifest = json.dumps({
+        'epoch': epoch,
+        'version': version,
+        'teams': teams,
+        'team_counters': _TEAM_COUNTERS,
+        'arrays': entries,
+        'feature_columns': feature_columns,
+        'model_offset': model_offset,
+        'model_size': len(model_bytes),
+    }).encode('utf-8')
+
+    data_shm = shared_memory.SharedMemory(name=_data_name(prefix, epoch, version), create=True,
+                                          size=max(model_offset + len(model_bytes), 1))
+    for entry in entries:
+        values = arrays[entry['name']]
+        data_shm.buf[entry['offset']:entry['offset'] + values.nbytes] = values.tobytes()
+    data_shm.buf[model_offset:model_offset + len(model_bytes)] = model_bytes
+
+    manifest_shm = shared_memory.SharedMemory(name=_manifest_name(prefix, epoch, version), create=True, size=8 + len(manifest))
+    manifest_shm.buf[:8] = struct.pack('<q', len(manifest))
+    manifest_shm.buf[8:8 + len(manifest)] = manifest
+
+    # Cambiamos la versión solo cuando todo está escrito: los workers ven la versión vieja o la nueva completa
+    control_shm.buf[:_CONTROL_SIZE] = struct.pack(_CONTROL_FORMAT, epoch, version)
+
+    # Los workers que siguen usando la versión anterior conservan su mapeo tras el unlink
+    if published is not None:
+        for shm in published['segments']:
+            shm.close()
+            shm.unlink()
+
+    print(f"Estado compartido publicado: versión {version}, {len(teams)} equipos, {len(arrays['h2h_pairs'])} parejas H2H, modelo de {len(model_bytes)} bytes.")
+
+    return {'epoch': epoch, 'version': version, 'control': control_shm, 'segments': [data_shm, manifest_shm]}
+
+def release_shared_state(published):
+    """Libera todos los segmentos creados por publish_shared_state (solo el proceso cargador)."""
+    for shm in published['segments'] + [published['control']]:
+        shm.close()
+        shm.unlink()
+
+def _close_attached(state):
+    """Suelta las vistas y cierra los segmentos de una versión que ya no se usa en este worker."""
+    state['arrays'].clear()
+    for shm in state['segments']:
+        try:
+            shm.close()
+        except BufferError:
+            pass # Alguien conserva todavía una vista; el mapeo se libera cuando la suelte
+
+def attach_shared_state(prefix=SHARED_STATE_PREFIX, current=None):
+    """
+    Se conecta al estado publicado por el proceso cargador. Si 'current' ya corresponde
+    a la versión publicada se devuelve tal cual, así que se puede llamar en cada petición;
+    si hay una versión nueva, se cierran los segmentos de 'current'.
+
+    Los arrays de estado de los equipos y del índice H2H son vistas sobre la memoria
+    compartida (sin copia); get_shared_team_state lee de ellos solo lo que necesita un
+    partido. El modelo sí se deserializa en cada worker, una vez por versión.
+
+    Args:
+        prefix (str): Prefijo de los nombres de los segmentos.
+        current (dict, opcional): Estado devuelto por una llamada anterior.
+
+    Returns:
+        dict: Con 'version', 'teams', 'model', 'label_encoder' y 'feature_columns',
+              o None si no hay ningún estado publicado.
+    """
+    # Reintentamos por si el cargador publica y borra la versión leída justo mientras nos conectamos
+    for _ in range(3):
+        try:
+            epoch, version = _read_control(prefix)
+        except FileNotFoundError:
+            if current is not None:
+                # El cargador se está reiniciando: seguimos con la última versión conocida
+                return current
+            print(f"Error: No hay estado compartido publicado con el prefijo '{prefix}'. Ejecuta primero src/shared_state.py.")
+            return None
+        if current is not None and (current['epoch'], current['version']) == (epoch, version):
+            return current
+        data_shm = None
+        try:
+            data_shm = _attach_segment(_data_name(prefix, epoch, version))
+            manifest_shm = _attach_segment(_manifest_name(prefix, epoch, version))
+            break
+        except FileNotFoundError:
+            if data_shm is not None:
+                data_shm.close()
+            time.sleep(0.01)
+    else:
+        print("Error: No se pudo conectar a la versión publicada del estado compartido.")
+        return current
+
+    manifest_size = struct.unpack('<q', bytes(manifest_shm.buf[:8]))[0]
+    manifest = json.loads(bytes(manifest_shm.buf[8:8 + manifest_size]).decode('utf-8'))
+
+    arrays = {}
+    for entry in manifest['arrays']:
+        arrays[entry['name']] = np.ndarray(tuple(entry['shape']), dtype=np.dtype(entry['dtype']),
+                                           buffer=data_shm.buf, offset=entry['offset'])
+
+    model_start = manifest['model_offset']
+    model, label_encoder = pickle.loads(data_shm.buf[model_start:model_start + manifest['model_size']])
+
+    teams = manifest['teams']
+    pair_rows = {(teams[a], teams[b]): i for i, (a, b) in enumerate(arrays['h2h_pairs'].tolist())}
+
+    print(f"Conectado al estado compartido, versión {manifest['version']}.")
+
+    if current is not None:
+        _close_attached(current)
+
+    # Guardamos los segmentos en el diccionario para que las vistas sigan siendo válidas
+    return {
+        'epoch': manifest['epoch'],
+        'version': manifest['version'],
+        'teams': teams,
+        'team_rows': {team: i for i, team in enumerate(teams)},
+        'pair_rows': pair_rows,
+        'team_counters': manifest['team_counters'],
+        'arrays': arrays,
+        'model': model,
+        'label_encoder': label_encoder,
+        'feature_columns': manifest['feature_columns'],
+        'segments': [data_shm, manifest_shm],
+    }
+
+def get_shared_team_state(state, home_team, away_team):
+    """
+    Reconstruye, a partir de los arrays compartidos, solo el estado de los dos equipos y de
+    su pareja H2H, con la misma forma que build_team_state. Coste constante por partido.
+
+    Args:
+        state (dict): Estado devuelto por attach_shared_state.
+        home_team (str): Nombre del equipo local.
+        away_team (str): Nombre del equipo visitante.
+
+    Returns:
+        tuple: (team_stats, h2h_index) para pasar como team_state a make_prediction_for_match.
+    """
+    arrays = state['arrays']
+    team_stats = {}
+    for team in (home_team, away_team):
+        row = state['team_rows'].get(team)
+        if row is None:
+            continue # Equipo sin historial: get_match_features usa contadores a cero
+        stats = dict(zip(state['team_counters'], arrays['team_counters'][row].tolist()))
+        played = arrays['form_results'][row] >= 0
+        stats['Last5GoalsScored'] = arrays['form_goals_scored'][row][played].tolist()
+        stats['Last5GoalsConceded'] = arrays['form_goals_conceded'][row][played].tolist()
+        stats['Last5Results'] = [_FORM_RESULTS[code] for code in arrays['form_results'][row][played].tolist()]
+        team_stats[team] = stats
+
+    h2h_index = {}
+    key = _h2h_key(home_team, away_team)
+    row = state['pair_rows'].get(key)
+    if row is not None:
+        team_a, team_b = key
+        (matches, draws, goal_diff, wins_a, wins_b,
+         venue_a_matches, venue_a_wins, venue_a_goal_diff,
+         venue_b_matches, venue_b_wins, venue_b_goal_diff) = arrays['h2h_counters'][row].tolist()
+        winners = {0: team_a, 1: team_b, _H2H_DRAW_CODE: 'D'}
+        h2h_index[key] = {
+            'Matches': matches, 'Draws': draws, 'GoalDiff': goal_diff,
+            'LastResults': [winners[code] for code in arrays['h2h_last_results'][row].tolist() if code >= 0],
+            'Wins': {team_a: wins_a, team_b: wins_b},
+            'Venue': {
+                team_a: {'Matches': venue_a_matches, 'Wins': venue_a_wins, 'GoalDiff': venue_a_goal_diff},
+                team_b: {'Matches': venue_b_matches, 'Wins': venue_b_wins, 'GoalDiff': venue_b_goal_diff},
+            },
+        }
+
+    return team_stats, h2h_index
+
+def _input_signature():
+    """Fechas de modificación de los CSV y del modelo, para saber si hay que volver a publicar."""
+    paths = [os.path.join(DATA_FOLDER, f) for f in os.listdir(DATA_FOLDER) if f.endswith('.csv')]
+    paths += [MODEL_PATH, ENCODER_PATH]
+    return tuple(sorted((path, os.path.getmtime(path)) for path in paths if os.path.exists(path)))
+
+def _stop_loader(signum, frame):
+    raise KeyboardInterrupt
+
+if __name__ == "__main__":
+    # Proceso cargador: lee los datos y el modelo, acumula el estado de los equipos una vez
+    # y lo publica para todos los workers. Debe seguir vivo mientras haya workers; solo al
+    # detenerlo se liberan los segmentos.
+    print("--- Publicando el estado del modelo en memoria compartida ---")
+    signal.signal(signal.SIGTERM, _stop_loader)
+    prefix = os.environ.get('FOOTBALL_AI_SHARED_STATE', SHARED_STATE_PREFIX)
+    published = None
+    published_signature = None
+    try:
+        while True:
+            signature = _input_signature()
+            if signature != published_signature:
+                # Un fallo al refrescar (ej. un CSV a medio escribir) no debe tumbar a los workers:
+                # mantenemos la versión publicada y lo reintentamos en la siguiente comprobación.
+                try:
+                    df_raw = load_league_data(data_folder=DATA_FOLDER)
+                    model, label_encoder = load_model_and_encoder(model_path=MODEL_PATH, encoder_path=ENCODER_PATH)
+                    if model is None or df_raw.empty:
+                        print("Error: No se pudieron cargar los datos o el modelo. Se mantiene la versión publicada.")
+                    else:
+                        team_stats, h2h_index = build_team_state(df_raw)
+                        published = publish_shared_state(team_stats, h2h_index, model, label_encoder,
+                                                         prefix=prefix, published=published)
+                        published_signature = signature
+                except Exception as e:
+                    print(f"Error al refrescar el estado compartido: {e}. Se mantiene la versión publicada.")
+            time.sleep(REFRESH_CHECK_INTERVAL_SECONDS)
+    except KeyboardInterrupt:
+        print("\nDeteniendo el proceso cargador...")
+    finally:
+        if published is not None:
+            release_shared_state(published)
+            print("Segmentos de memoria compartida liberados.")